@@ -6,10 +6,13 @@ Filter CSV lines and columns for words or numerical interval.
 
 Allows automatic minimum and maximum date conversion to timestamp.
 
+Reads and writes compressed files ending with .gz or .zst (zstandard).
+
 usage: filter_csv [-h] [-o OUTPUT] [-s STRINGS] [-c COLUMNS] [-m MINIMUM]
                   [-M MAXIMUM] [-a] [-w] [-i] [-v] [-d DELIMITER]
                   [-q {0,1,2,3}] [-e ENCODING] [--index-ignore]
                   [--max-field-size-limit] [--split-character SPLIT_CHARACTER]
+                  [--reorder-columns] [-j JOBS] [--arrow]
                   input
 
 positional arguments:
@@ -42,18 +45,72 @@ optional arguments:
                         extend field size limit to maximum allowed
   --split-character SPLIT_CHARACTER
                         to split filter strings (default: comma; 'none' or 'false' to ignore)
+  --reorder-columns     check columns with most matches first (sampled)
+  -j JOBS, --jobs JOBS  parallel processes, requires quoting 3 (default: 1)
+  --arrow               filter with pyarrow (quotes strings, LF line endings)
 '''
 
 from argparse import ArgumentParser
-from csv import field_size_limit, reader, writer
+from concurrent.futures import ProcessPoolExecutor
+from csv import Error, Sniffer, field_size_limit, reader, writer
 from datetime import datetime, timezone
-from os.path import basename, isfile, splitext
-from re import search
-from string import punctuation
-from sys import maxsize, stderr
+from gzip import GzipFile
+from io import BufferedReader, StringIO, TextIOWrapper
+from itertools import chain, compress, islice
+from locale import getpreferredencoding
+from mmap import ACCESS_READ, mmap
+from os import close, fstat, remove
+from os.path import abspath, basename, dirname, getsize, isfile, splitext
+from re import IGNORECASE, escape
+from re import compile as re_compile
+from shutil import copyfileobj
+from stat import S_ISREG
+from sys import maxsize, stderr, stdout
+from tempfile import mkstemp
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ENCODING = 'utf-8'
 
+AUTOMATON_MIN_STRINGS = 9
+
+BUFFER_SIZE = 1 << 20
+
+INLINE_MAX_STRINGS = 8
+
+DATE_REGEX = re_compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$')
+
+CHUNK_SIZE = 1 << 20
+
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+COMPRESS_LEVEL = 1
+
+NUMPY_BATCH_SIZE = 65536
+
+REORDER_SAMPLE_SIZE = 1000
+
+WRITE_BATCH_SIZE = 4096
+
+ARROW_BLOCK_SIZE = 8 << 20
+
+ARROW_QUOTING = {0: 'needed',
+                 1: 'all_valid',
+                 3: 'none'}
+
 QUOTING = {0: 'minimal',
            1: 'all',
            2: 'non-numeric',
@@ -63,16 +120,14 @@ def filter_csv(input_name, output_name=None,
     strings=[], columns=[], minimum=None, maximum=None,
     all_words=False, whole_words=False, ignore_cases=False,
     invert=False, delimiter=None, quoting=0, encoding=ENCODING,
-    index_ignore=False, max_field_size=False, split_character=None):
+    index_ignore=False, max_field_size=False, split_character=None,
+    reorder_columns=False, jobs=1, use_arrow=False):
     '''
     Perform CSV file filtering.
     '''
     filter_columns_only = False
 
-    quotechar = '"'
-
-    if quoting == 3:
-        quotechar = ''
+    quotechar = None if quoting == 3 else '"'
 
     if split_character in ('none', 'false'):
         split_character = None
@@ -96,9 +151,9 @@ def filter_csv(input_name, output_name=None,
                 strings = strings.split('+')
             for w in strings:
                 strings_set.add(w.lower() if ignore_cases else w)
-            strings = set(strings_set)
+            strings = strings_set
 
-    elif any(x for x in [minimum, maximum]):
+    elif minimum is not None or maximum is not None:
         # check for columns
         if not columns:
             print('Error: missing required COLUMNS argument.', file=stderr)
@@ -128,10 +183,29 @@ def filter_csv(input_name, output_name=None,
     if isinstance(columns, str):
         columns = columns.split(',')
 
-    if any(x in columns for x in [0, '0']):
+    if 0 in columns or '0' in columns:
         print('Error: invalid column (0), must be >= 1.', file=stderr)
         raise SystemExit
 
+    if jobs > 1 and quoting != 3:
+        print('Error: parallel jobs require unquoted files (-q 3).', file=stderr)
+        raise SystemExit
+
+    if jobs > 1 and not is_ascii_compatible(encoding or getpreferredencoding(False)):
+        print('Error: parallel jobs require an ASCII compatible encoding.', file=stderr)
+        raise SystemExit
+
+    if use_arrow:
+        try: # only imported when asked for
+            import pyarrow as pa
+        except ImportError:
+            print("Error: missing 'pyarrow' module to filter with it.", file=stderr)
+            raise SystemExit
+
+    if jobs > 1 and splitext(input_name)[1].lower() in COMPRESSED_EXTENSIONS:
+        print('Error: parallel jobs require uncompressed input file.', file=stderr)
+        raise SystemExit
+
     header_filtered = []
     columns_to_filter = []
     int_lines_matched = 1 # header
@@ -139,8 +213,15 @@ def filter_csv(input_name, output_name=None,
     if not delimiter:
         delimiter = get_file_delimiter(input_name, encoding)
 
-    with open(input_name, 'rt', encoding=encoding) as input_file:
-        file_reader = reader(input_file, delimiter=delimiter, quoting=quoting)
+    match = None if filter_columns_only else\
+            get_match_function(strings, minimum, maximum, all_words, whole_words, ignore_cases)
+
+    with open_file(input_name, 'rt', encoding, '', BUFFER_SIZE) as input_file:
+        if quoting == 3 and is_ascii_compatible(input_file.encoding): # no quoted fields to parse
+            file_reader = read_unquoted(input_file.buffer, delimiter, input_file.encoding)
+        else:
+            file_reader = reader(input_file, delimiter=delimiter, quoting=quoting)
+
         header = next(file_reader)
 
         if strings and not columns:
@@ -165,93 +246,98 @@ def filter_csv(input_name, output_name=None,
 
         # invert columns to filter if cutting only
         if invert and filter_columns_only:
-            # get filtered columns
-            unfiltered_columns = columns_to_filter
-            unfiltered_titles = header_filtered
-            # get original columns
-            header_filtered = header
-            columns_to_filter = []
-            for column_number in range(0, len(header)):
-                columns_to_filter.append(column_number)
-            # invert filter columns
-            for column in unfiltered_columns:
-                columns_to_filter.remove(column)
-            for title in unfiltered_titles:
-                header_filtered.remove(title)
-
-        with open(output_name, 'w', newline='', encoding=encoding) as output_file:
-            file_writer = writer(output_file, delimiter=delimiter, quoting=quoting, quotechar=quotechar)
-
-            if filter_columns_only:
-                file_writer.writerow(header_filtered)
-            else: # all columns
-                file_writer.writerow(header)
-
-            for line in file_reader:
-                index = file_reader.line_num
-                print('Read %s lines.' % index, end='\r')\
-                if (index/10000).is_integer() else None
-
-                data_to_filter = []
-
-                for column in columns_to_filter:
-                    try: # filter line
-                        filter_match = False
-
-                        if strings:
-                            data_to_filter = line[column]
-
-                            if ignore_cases:
-                                data_to_filter = data_to_filter.lower()
-
-                            if whole_words:
-                                if (all_words and all(search(r'\b%s\b' % s, data_to_filter) for s in strings))\
-                                or (not all_words and any(search(r'\b%s\b' % s, data_to_filter) for s in strings)):
-                                    filter_match = True
-
-                            elif (all_words and all(s in data_to_filter for s in strings))\
-                            or (not all_words and any(s in data_to_filter for s in strings)):
-                                filter_match = True
-
-                        elif any(i for i in [minimum, maximum]):
-                            data_to_filter = line[column]
-
-                            if is_number(data_to_filter):
-                                data_to_filter = float(data_to_filter)
-
-                            if all(i for i in [minimum, maximum]):
-                                if (minimum <= data_to_filter <= maximum):
-                                    filter_match = True
-
-                            elif (minimum and minimum <= data_to_filter)\
-                            or (maximum and maximum >= data_to_filter):
-                                filter_match = True
-
-                        elif filter_columns_only:
-                            data_to_filter.append(line[column])
-
-                        if filter_match:
-                            break
-
-                    except IndexError:
-                        if index_ignore:
-                            continue
-                        raise
+            unfiltered_columns = set(columns_to_filter)
+            columns_to_filter = [i for i in range(len(header)) if i not in unfiltered_columns]
+            header_filtered = [header[i] for i in columns_to_filter]
+
+        # sample lines to check most matching columns first
+        if reorder_columns and not filter_columns_only and len(columns_to_filter) > 1:
+            sample = list(islice(file_reader, REORDER_SAMPLE_SIZE))
+            columns_to_filter = sort_columns_by_matches(sample, columns_to_filter, match)
+            file_reader = chain(sample, file_reader)
+
+        int_lines_total = None
+
+        if jobs > 1:
+            int_lines_total, int_lines_matched = filter_csv_parallel(
+                input_name, output_name, header_filtered if filter_columns_only else header,
+                columns_to_filter, strings, minimum, maximum, all_words, whole_words,
+                ignore_cases, invert, delimiter, input_file.encoding, index_ignore,
+                filter_columns_only, jobs)
+
+        elif use_arrow and not (filter_columns_only or index_ignore or reorder_columns or whole_words)\
+        and quoting != 2 and delimiter not in '\r\n' and (encoding or ENCODING).lower() in ('utf-8', 'utf8'):
+            try:
+                int_lines_total, int_lines_matched = filter_csv_arrow(
+                    input_name, output_name, header, columns_to_filter,
+                    strings, minimum, maximum, all_words, ignore_cases,
+                    invert, delimiter, quoting, quotechar)
+            except pa.ArrowInvalid as e:
+                print('Warning: %s, filtering with csv module instead.' % e, file=stderr)
+
+        if int_lines_total is None:
+            with open_file(output_name, 'wt', encoding, '', BUFFER_SIZE) as output_file:
+                file_writer = writer(output_file, delimiter=delimiter, quoting=quoting, quotechar=quotechar)
 
                 if filter_columns_only:
-                    line = data_to_filter
-
-                if (filter_match and not invert)\
-                or (not filter_match and invert)\
-                or (filter_columns_only and data_to_filter != []):
-                    int_lines_matched += 1
-                    file_writer.writerow(line)
+                    file_writer.writerow(header_filtered)
+                else: # all columns
+                    file_writer.writerow(header)
+
+                index = 1 # header
+
+                # compare numerical interval on column arrays
+                if np and not (strings or filter_columns_only) and len(columns_to_filter) == 1:
+                    column = columns_to_filter[0]
+
+                    for lines in iter(lambda: list(islice(file_reader, NUMPY_BATCH_SIZE)), []):
+                        index += len(lines)
+                        stdout.write('Read %s lines.\r' % index)
+
+                        if index_ignore: # short lines never match
+                            cells = (line[column] if len(line) > column else 'nan' for line in lines)
+                        else:
+                            cells = (line[column] for line in lines)
+
+                        try:
+                            values = np.fromiter(cells, dtype=np.float64, count=len(lines))
+                        except (IndexError, ValueError): # write lines matched before the bad one
+                            filter_lines(lines, file_writer, columns_to_filter,
+                                         get_filter_function(columns_to_filter, match, strings, minimum, maximum,
+                                                             invert=invert, index_ignore=index_ignore), invert)
+                            raise
+
+                        if minimum is not None and maximum is not None:
+                            keep = (values >= minimum) & (values <= maximum)
+                        elif minimum is not None:
+                            keep = values >= minimum
+                        else:
+                            keep = values <= maximum
+
+                        if invert:
+                            keep = ~keep
+
+                        lines = list(compress(lines, keep))
+                        int_lines_matched += len(lines)
+                        file_writer.writerows(lines)
+
+                else:
+                    filter_row = None if filter_columns_only else\
+                                 get_filter_function(columns_to_filter, match, strings, minimum, maximum,
+                                                     all_words, whole_words, ignore_cases, invert, index_ignore)
+
+                    int_lines_read, int_lines_written = filter_lines(
+                        file_reader, file_writer, columns_to_filter, filter_row,
+                        invert, index_ignore, filter_columns_only)
+                    index += int_lines_read
+                    int_lines_matched += int_lines_written
+
+            int_lines_total = index
 
     int_header_total = len(header)
     int_header_unmatched = int_header_total - len(header_filtered)
     int_header_matched = int_header_total - int_header_unmatched
 
-    int_lines_total = file_reader.line_num
     int_lines_unmatched = int_lines_total - int_lines_matched
 
     print('Read', str(int_header_total), 'total columns.\n'+
@@ -264,16 +350,37 @@ def filter_csv(input_name, output_name=None,
           str(int_lines_unmatched), 'unmatching lines.\n'+
           str(int_lines_matched), 'lines after filtering.')
 
+def automaton_match_all(automaton, str_):
+    '''
+    Returns True if all strings in automaton are found in input,
+    setting one bit per string index found while scanning it once.
+    '''
+    all_found = (1 << len(automaton)) - 1
+    found = 0
+    for _, i in automaton.iter(str_):
+        found |= 1 << i
+        if found == all_found:
+            return True
+    return False
+
+def build_automaton(strings):
+    '''
+    Returns Aho-Corasick automaton for matching
+    all strings at once, valued by string index.
+    '''
+    automaton = ahocorasick.Automaton()
+    for i, s in enumerate(set(strings)):
+        automaton.add_word(s, i)
+    automaton.make_automaton()
+    return automaton
+
 def date_str_with_time(date_str, default_time='00:00:00'):
     '''
     Returns string in YYYY-MM-DD hh:mm:ss format.
     '''
     if len(date_str) >= 10:
-        y = int(date_str[:4])
         y = date_str[:4]
-        m = int(date_str[5:7])
         m = date_str[5:7]
-        d = int(date_str[8:10])
         d = date_str[8:10]
 
     # get time from string
@@ -292,45 +399,380 @@ def datetime_to_timestamp(date_time, utc=True):
         return date_time.replace(tzinfo=timezone.utc).timestamp()
     return date_time.timestamp()
 
-def get_file_delimiter(input_name, encoding=ENCODING):
+def filter_csv_arrow(input_name, output_name, header, columns_to_filter,
+    strings=[], minimum=None, maximum=None, all_words=False, ignore_cases=False,
+    invert=False, delimiter=',', quoting=0, quotechar='"'):
+    '''
+    Perform CSV file filtering on streamed record batches,
+    requires `pyarrow` to be installed. Returns the number
+    of lines read and written, including header.
+    '''
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+
+    names = [str(i) for i in range(len(header))]
+
+    input_file = pa_csv.open_csv(
+        input_name,
+        read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE, column_names=names, skip_rows=1),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, quote_char=False if quoting == 3 else '"',
+                                          newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names}))
+
+    # header is written apart, as arrow always quotes it
+    header_line = StringIO()
+    writer(header_line, delimiter=delimiter, quoting=quoting, quotechar=quotechar, lineterminator='\n').writerow(header)
+
+    int_lines_total = int_lines_matched = 1 # header
+
+    with open_file(output_name, 'wb') as output_file:
+        output_file.write(header_line.getvalue().encode())
+
+        file_writer = pa_csv.CSVWriter(output_file, input_file.schema,
+                                       write_options=pa_csv.WriteOptions(include_header=False,
+                                                                         delimiter=delimiter,
+                                                                         quoting_style=ARROW_QUOTING[quoting]))
+        for batch in input_file:
+            int_lines_total += batch.num_rows
+            mask = None
+
+            for column in columns_to_filter:
+                data_to_filter = batch.column(column)
+                filter_match = None
+
+                if strings:
+                    matches = [pc.match_substring(data_to_filter, s, ignore_case=ignore_cases)
+                               for s in strings]
+                    for m in matches:
+                        filter_match = m if filter_match is None else\
+                                       (pc.and_ if all_words else pc.or_)(filter_match, m)
+
+                else:
+                    data_to_filter = pc.cast(data_to_filter, pa.float64())
+                    if minimum is not None:
+                        filter_match = pc.greater_equal(data_to_filter, minimum)
+                    if maximum is not None:
+                        m = pc.less_equal(data_to_filter, maximum)
+                        filter_match = m if filter_match is None else pc.and_(filter_match, m)
+
+                mask = filter_match if mask is None else pc.or_(mask, filter_match)
+
+            if invert:
+                mask = pc.invert(mask)
+
+            batch = batch.filter(mask)
+            file_writer.write_batch(batch)
+
+            int_lines_matched += batch.num_rows
+            print('Read %s lines.' % int_lines_total, end='\r')
+
+        file_writer.close()
+
+    return int_lines_total, int_lines_matched
+
+def filter_csv_chunk(input_name, output_name, start, end, columns_to_filter,
+    strings=[], minimum=None, maximum=None, all_words=False, whole_words=False,
+    ignore_cases=False, invert=False, delimiter=',', encoding=ENCODING,
+    index_ignore=False, filter_columns_only=False):
+    '''
+    Perform CSV file filtering on a byte range of lines
+    from a file with no quoted fields, writing matches
+    with no header. Returns the number of lines read and written.
+    '''
+    filter_row = None if filter_columns_only else\
+                 get_filter_function(columns_to_filter,
+                                     get_match_function(strings, minimum, maximum, all_words, whole_words, ignore_cases),
+                                     strings, minimum, maximum, all_words, whole_words, ignore_cases, invert, index_ignore)
+
+    with open(input_name, 'rb', buffering=BUFFER_SIZE) as input_file,\
+    open(output_name, 'w', newline='', encoding=encoding, buffering=BUFFER_SIZE) as output_file:
+        input_file.seek(start)
+        file_reader = read_unquoted(input_file, delimiter, encoding, length=end-start)
+        file_writer = writer(output_file, delimiter=delimiter, quoting=3, quotechar=None)
+        return filter_lines(file_reader, file_writer, columns_to_filter, filter_row,
+                            invert, index_ignore, filter_columns_only)
+
+def filter_csv_parallel(input_name, output_name, header, columns_to_filter,
+    strings=[], minimum=None, maximum=None, all_words=False, whole_words=False,
+    ignore_cases=False, invert=False, delimiter=',', encoding=ENCODING,
+    index_ignore=False, filter_columns_only=False, jobs=2):
+    '''
+    Perform CSV file filtering with parallel processes, each on
+    a byte range split by line breaks, as fields are not quoted.
+    Returns the number of lines read and written, including header.
+    '''
+    file_size = getsize(input_name)
+
+    # align byte ranges to line starts
+    with open(input_name, 'rb') as input_file:
+        input_file.readline() # header
+        offsets = [input_file.tell()]
+        for i in range(1, jobs):
+            input_file.seek(offsets[0] + (file_size - offsets[0]) * i // jobs - 1)
+            input_file.readline()
+            offsets.append(input_file.tell())
+        offsets.append(file_size)
+
+    ranges = [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+    output_names = []
+
+    try:
+        for _ in ranges:
+            fd, name = mkstemp(suffix='.csv', dir=dirname(abspath(output_name)))
+            close(fd)
+            output_names.append(name)
+
+        with ProcessPoolExecutor(jobs) as executor:
+            results = [executor.submit(filter_csv_chunk, input_name, name, start, end, columns_to_filter,
+                                       strings, minimum, maximum, all_words, whole_words, ignore_cases,
+                                       invert, delimiter, encoding, index_ignore, filter_columns_only)
+                       for name, (start, end) in zip(output_names, ranges)]
+            results = [result.result() for result in results]
+
+        with open_file(output_name, 'wt', encoding, '', BUFFER_SIZE) as output_file:
+            writer(output_file, delimiter=delimiter, quoting=3, quotechar=None).writerow(header)
+            output_file.flush()
+            for name in output_names:
+                with open(name, 'rb') as f:
+                    copyfileobj(f, output_file.buffer, BUFFER_SIZE)
+
+    finally:
+        for name in output_names:
+            remove(name)
+
+    return (1 + sum(r[0] for r in results),
+            1 + sum(r[1] for r in results))
+
+def filter_lines(file_reader, file_writer, columns_to_filter, filter_row=None,
+    invert=False, index_ignore=False, filter_columns_only=False):
+    '''
+    Writes lines from reader accepted by filter function
+    to writer, or only their columns if cutting. Returns
+    the number of lines read and written.
+    '''
+    int_lines_matched = 0
+
+    writerows = file_writer.writerows
+    stdout_write = stdout.write
+
+    # matched lines are written in batches
+    output_lines = []
+    append = output_lines.append
+
+    index = 0
+
+    try:
+        for index, line in enumerate(file_reader, start=1):
+            if not index & 0x3FFF: # every 16384 lines
+                stdout_write('Read %s lines.\r' % index)
+
+            if filter_columns_only:
+                data_to_filter = []
+
+                for column in columns_to_filter:
+                    try:
+                        data_to_filter.append(line[column])
+                    except IndexError:
+                        if index_ignore:
+                            continue
+                        raise
+
+                if data_to_filter or invert:
+                    int_lines_matched += 1
+                    append(data_to_filter)
+                    if len(output_lines) == WRITE_BATCH_SIZE:
+                        writerows(output_lines)
+                        output_lines.clear()
+
+                continue
+
+            if filter_row(line):
+                int_lines_matched += 1
+                append(line)
+                if len(output_lines) == WRITE_BATCH_SIZE:
+                    writerows(output_lines)
+                    output_lines.clear()
+
+    finally: # keep lines matched before any error
+        if output_lines:
+            writerows(output_lines)
+
+    return index, int_lines_matched
+
+def get_file_delimiter(input_name, encoding=ENCODING, size=8192):
     '''
-    Returns character delimiter from file.
+    Returns character delimiter from file, counting
+    candidates in the raw bytes of its first line.
     '''
-    with open(input_name, 'rt', encoding=encoding) as input_file:
-        file_reader = reader(input_file)
-        header = str(next(file_reader))
+    with open_file(input_name, 'rb') as input_file:
+        sample = input_file.read(size)
 
-    for i in ['|', '\\t', ';', ',']:
-        if i in header: # \\t != \t
-            return i.replace('\\t', '\t')
+    header = sample.split(b'\n', 1)[0]
+    counts = {d: header.count(d) for d in (b'|', b'\t', b';', b',')}
+    delimiter = max(counts, key=counts.get)
 
-    return '\n'
+    if counts[delimiter]:
+        return delimiter.decode()
+
+    try: # look further than first line
+        return Sniffer().sniff(sample.decode(encoding or ENCODING, 'ignore'), '|\t;,').delimiter
+    except Error:
+        return '\n'
+
+def get_filter_function(columns_to_filter, match, strings=[], minimum=None, maximum=None,
+    all_words=False, whole_words=False, ignore_cases=False, invert=False, index_ignore=False):
+    '''
+    Returns function to accept or reject a line, generated from
+    source with only the columns and checks the arguments need.
+    Substrings are inlined up to a few, falling back to match.
+    '''
+    lower = False
+
+    if strings and not whole_words and len(strings) <= INLINE_MAX_STRINGS:
+        expr = (' and ' if all_words else ' or ').join('%r in c' % s for s in strings)
+        lower = ignore_cases
+    elif strings:
+        expr = 'match(c)'
+    elif minimum is not None and maximum is not None:
+        expr = 'minimum <= float(c) <= maximum'
+    elif minimum is not None:
+        expr = 'minimum <= float(c)'
+    else:
+        expr = 'float(c) <= maximum'
+
+    source = ['def filter_row(line, match=match, minimum=minimum, maximum=maximum, float=float):']
+
+    for column in columns_to_filter:
+        indent = '    '
+        if index_ignore:
+            source.append('    if len(line) > %d:' % column)
+            indent = '        '
+        source.append('%sc = line[%d]%s' % (indent, column, '.lower()' if lower else ''))
+        source.append('%sif %s:' % (indent, expr))
+        source.append('%s    return %s' % (indent, not invert))
+
+    source.append('    return %s' % bool(invert))
+
+    namespace = {'match': match, 'minimum': minimum, 'maximum': maximum}
+    exec(compile('\n'.join(source), '<filter>', 'exec'), namespace)
+    return namespace['filter_row']
+
+def get_match_function(strings=[], minimum=None, maximum=None,
+    all_words=False, whole_words=False, ignore_cases=False):
+    '''
+    Returns function to match a single field, chosen once
+    from filter arguments instead of checked per field.
+    '''
+    if strings and whole_words:
+        flags = IGNORECASE if ignore_cases else 0
+
+        if all_words:
+            regex_all = tuple(re_compile(r'\b%s\b' % escape(s), flags) for s in strings)
+
+            def whole_all(data):
+                return all(r.search(data) for r in regex_all)
+
+            return whole_all
+
+        search = re_compile(r'\b(?:%s)\b' % '|'.join(escape(s) for s in strings), flags).search
+
+        def whole_any(data):
+            return search(data) is not None
+
+        return whole_any
+
+    if strings and ahocorasick\
+    and len(strings) >= AUTOMATON_MIN_STRINGS and '' not in strings:
+        automaton = build_automaton(strings)
+
+        if all_words:
+            def automaton_all(data):
+                return automaton_match_all(automaton, data.lower() if ignore_cases else data)
+
+            return automaton_all
+
+        iter_ = automaton.iter
+
+        def automaton_any(data):
+            return next(iter_(data.lower() if ignore_cases else data), None) is not None
+
+        return automaton_any
+
+    if strings:
+        strings = tuple(strings)
+
+        # alternation is searched at once by regex engine
+        if not all_words and len(strings) > 1:
+            search = re_compile('|'.join(escape(s) for s in sorted(strings, key=len, reverse=True)),
+                                IGNORECASE if ignore_cases else 0).search
+
+            def substr_any_regex(data):
+                return search(data) is not None
+
+            return substr_any_regex
+
+        # str.lower() runs an ASCII fast path in C,
+        # which is quicker than a str.translate() table
+        if all_words and ignore_cases:
+            def substr_all_ci(data):
+                data = data.lower()
+                return all(s in data for s in strings)
+
+            return substr_all_ci
+
+        if all_words:
+            def substr_all(data):
+                return all(s in data for s in strings)
+
+            return substr_all
+
+        if ignore_cases:
+            def substr_any_ci(data):
+                data = data.lower()
+                return any(s in data for s in strings)
+
+            return substr_any_ci
+
+        def substr_any(data):
+            return any(s in data for s in strings)
+
+        return substr_any
+
+    if minimum is not None and maximum is not None:
+        def range_between(data):
+            return minimum <= float(data) <= maximum
+
+        return range_between
+
+    def range_open(data):
+        data = float(data)
+        return (minimum is not None and minimum <= data)\
+            or (maximum is not None and data <= maximum)
+
+    return range_open
+
+def is_ascii_compatible(encoding):
+    '''
+    Returns True if encoding keeps line breaks as single
+    ASCII bytes, so that lines may be split by raw bytes.
+    '''
+    return '\r\n'.encode(encoding) == b'\r\n'
 
 def is_date(str_):
     '''
     Returns True if input is a date string.
     '''
-    try:
-        datetime.strptime(str_, '%Y-%m-%d %H:%M:%S')
-    except Exception:
-        try:
-            datetime.strptime(str_, '%Y-%m-%d')
-        except Exception:
-            return False
-    return True
+    return bool(DATE_REGEX.match(str_ or ''))
 
 def is_number(str_):
     '''
     Returns True if the input is an integer or float.
     '''
     try:
-        int(str_)
-    except Exception:
-        try:
-            float(str_)
-            return True
-        except Exception:
-            return False
+        float(str_)
+    except (TypeError, ValueError):
+        return False
     return True
 
 def load_list(filename):
@@ -361,6 +803,124 @@ def max_field_size_limit(d=10):
         else:
             return
 
+def open_file(name, mode='rt', encoding=ENCODING, newline=None, buffering=-1):
+    '''
+    Returns file object, compressed or decompressed on the
+    fly if name ends with .gz (gzip) or .zst (zstandard).
+    '''
+    ext = splitext(name)[1].lower()
+
+    if ext not in COMPRESSED_EXTENSIONS:
+        if 'b' in mode:
+            return open(name, mode, buffering=buffering)
+        return open(name, mode, encoding=encoding, newline=newline, buffering=buffering)
+
+    write = 'w' in mode
+
+    if ext == '.gz':
+        file = GzipFile(name, 'wb' if write else 'rb', compresslevel=COMPRESS_LEVEL)
+
+    elif zstandard:
+        file = open(name, 'wb' if write else 'rb')
+        file = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).stream_writer(file) if write\
+               else zstandard.ZstdDecompressor().stream_reader(file)
+
+    else:
+        print("Error: missing 'zstandard' module to open '%s'." % name, file=stderr)
+        raise SystemExit
+
+    if 'b' in mode:
+        return file
+    return TextIOWrapper(file, encoding=encoding, newline=newline)
+
+def read_chunks(input_file, size=CHUNK_SIZE, length=None):
+    '''
+    Yields chunks of bytes from file ending at line breaks.
+    Stops after length bytes from position if set.
+    '''
+    rest = b''
+
+    while True:
+        chunk = input_file.read1(size if length is None else min(size, length))
+
+        if not chunk:
+            break
+
+        if length is not None:
+            length -= len(chunk)
+
+        chunk = rest + chunk
+        end = chunk.rfind(b'\n') + 1
+        rest = chunk[end:]
+
+        if end:
+            yield chunk[:end]
+
+    if rest:
+        yield rest
+
+def read_chunks_mmap(input_file, size=CHUNK_SIZE, length=None):
+    '''
+    Yields chunks of bytes from memory mapped file ending at
+    line breaks found by C-level search, each sliced as a
+    single copy. Stops after length bytes from position if set.
+    '''
+    start = input_file.tell()
+
+    if start >= fstat(input_file.fileno()).st_size:
+        return
+
+    with mmap(input_file.fileno(), 0, access=ACCESS_READ) as mm:
+        end = len(mm) if length is None else start + length
+
+        while start < end:
+            stop = mm.rfind(b'\n', start, min(start + size, end)) + 1\
+                or mm.find(b'\n', start, end) + 1\
+                or end
+            yield mm[start:stop]
+            start = stop
+
+def read_unquoted(input_file, delimiter=',', encoding=ENCODING, size=CHUNK_SIZE, length=None):
+    '''
+    Yields lines split by delimiter from a binary file
+    with no quoted fields, decoding large chunks at once
+    instead of parsing it character by character.
+    Stops after length bytes from position if set.
+    '''
+    if isinstance(input_file, BufferedReader) and input_file.seekable()\
+    and S_ISREG(fstat(input_file.fileno()).st_mode): # not compressed or piped
+        chunks = read_chunks_mmap(input_file, size, length)
+    else:
+        chunks = read_chunks(input_file, size, length)
+
+    for chunk in chunks:
+        lines = chunk.decode(encoding).split('\n')
+
+        if not lines[-1]:
+            lines.pop() # after last line break
+
+        for line in lines:
+            if line.endswith('\r'):
+                line = line[:-1]
+            yield line.split(delimiter) if line else []
+
+def sort_columns_by_matches(lines, columns, match):
+    '''
+    Returns columns sorted by number of matching fields
+    in lines, so that the line loop may break earlier.
+    '''
+    matches = dict.fromkeys(columns, 0)
+
+    for line in lines:
+        for column in columns:
+            try:
+                if column < len(line) and match(line[column]):
+                    matches[column] += 1
+            except (TypeError, ValueError):
+                pass # left for the filter to raise if it reads it
+
+    return sorted(columns, key=matches.get, reverse=True)
+
 if __name__ == "__main__":
 
     parser = ArgumentParser()
@@ -381,6 +941,9 @@ if __name__ == "__main__":
     parser.add_argument('--index-ignore', action='store_true', help='skip line and bypass IndexError exceptions')
     parser.add_argument('--max-field-size-limit', action='store_true', help='extend field size limit to maximum allowed')
     parser.add_argument('--split-character', action='store', default=',', help="to split filter strings (default: comma; 'none' or 'false' to ignore)")
+    parser.add_argument('--reorder-columns', action='store_true', help='check columns with most matches first (sampled)')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1, help='parallel processes, requires quoting 3 (default: 1)')
+    parser.add_argument('--arrow', action='store_true', help='filter with pyarrow (quotes strings, LF line endings)')
 
     args = parser.parse_args()
 
@@ -399,4 +962,7 @@ if __name__ == "__main__":
                args.encoding,
                args.index_ignore,
                args.max_field_size_limit,
-               args.split_character)
+               args.split_character,
+               args.reorder_columns,
+               args.jobs,
+               args.arrow)